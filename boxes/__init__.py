@@ -14,20 +14,13 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-try:
-    import cairocffi
-
-    cairocffi.install_as_pycairo()
-except ImportError:
-    pass
-import cairo
 import math
 import sys
 import argparse
 from argparse import ArgumentParser
 import re
+import io
 from functools import wraps
-from xml.sax.saxutils import quoteattr
 from contextlib import contextmanager
 import copy
 
@@ -161,6 +154,22 @@ def argparseSections(s):
         raise argparse.ArgumentTypeError("Don't understand sections string")
 
 
+def argparsePrecision(s):
+    """
+    Parse number of decimals
+
+    :param s: string to parse
+
+    """
+    try:
+        n = int(s)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid int value: %r" % s)
+    if n < 0:
+        raise argparse.ArgumentTypeError("must not be negative")
+    return n
+
+
 class ArgparseEdgeType:
     """argparse type to select from a set of edge types"""
 
@@ -187,6 +196,8 @@ class ArgparseEdgeType:
         return """<select name="%s" size="1">\n%s</select>\n""" % (name, options)
 
     def inx(self, name, viewname, arg):
+        # xml.sax imports urllib.request which is slow to load
+        from xml.sax.saxutils import quoteattr
         return ('      <param name="%s" type="enum" gui-text="%s" gui-description=%s>\n' %
                 (name, viewname, quoteattr(arg.help or "")) +
                 ''.join(('        <item value="%s">%s %s</item>\n' % (
@@ -209,6 +220,70 @@ class BoolArg:
 
 boolarg = BoolArg()
 
+class EdgeDict(dict):
+    """Edges of a Boxes object by their char
+
+    Families of edges can be registered with placeholders that are
+    replaced by the actual edges when one of them is looked up for the
+    first time. Edges set directly take precedence over the placeholders.
+    """
+
+    class Family:
+        """Placeholder for edges not created yet"""
+
+        def __init__(self, factory):
+            self.factory = factory
+
+    def addFamily(self, chars, factory):
+        """Register edges created by factory
+
+        :param chars: chars of the edges factory returns
+        :param factory: callable returning a list of edges
+        """
+        family = self.Family(factory)
+        for c in chars:
+            dict.__setitem__(self, c, family)
+
+    def _build(self, family):
+        edges = family.factory()
+        for edge in edges:
+            if dict.get(self, edge.char) is family:
+                dict.__setitem__(self, edge.char, edge)
+        # drop chars the factory did not deliver
+        for c, v in list(dict.items(self)):
+            if v is family:
+                dict.__delitem__(self, c)
+
+    def __getitem__(self, char):
+        edge = dict.__getitem__(self, char)
+        if isinstance(edge, self.Family):
+            self._build(edge)
+            edge = dict.__getitem__(self, char)
+        return edge
+
+    def get(self, char, default=None):
+        try:
+            return self[char]
+        except (KeyError, TypeError):
+            return default
+
+    def buildAll(self):
+        """Create all edges not created yet"""
+        for c in list(dict.keys(self)):
+            self.get(c)
+
+    def values(self):
+        self.buildAll()
+        return dict.values(self)
+
+    def items(self):
+        self.buildAll()
+        return dict.items(self)
+
+    def copy(self):
+        self.buildAll()
+        return dict(dict.items(self))
+
 ##############################################################################
 ### Main class
 ##############################################################################
@@ -221,6 +296,9 @@ class Boxes:
 
     description = "" # Markdown syntax is supported
 
+    # prefixes of the settings only used by some output formats
+    formatSettings = {"GCode" : ("gcode",)}
+
     def __init__(self):
         self.formats = formats.Formats()
         self.ctx = None
@@ -256,6 +334,10 @@ class Boxes:
         defaultgroup.add_argument(
             "--burn", action="store", type=float, default=0.1,
             help="burn correction in mm (bigger values for tighter fit)")
+        defaultgroup.add_argument(
+            "--precision", action="store", type=argparsePrecision, default=3,
+            help="number of decimals of the coordinates in mm")
+        self.addSettingsArgs(formats.GCodeSettings)
 
     @contextmanager
     def saved_context(self):
@@ -399,6 +481,10 @@ class Boxes:
         prefix = prefix or settings.__name__[:-len("Settings")]
         settings.parserArguments(self.argparser, prefix, **defaults)
         self.edgesettings[prefix] =  {}
+        # keep the settings of the output formats after all others
+        groups = self.argparser._action_groups
+        groups.sort(key=lambda g: getattr(g, "prefix", None)
+                    in self.formatSettings)
         
 
     def parseArgs(self, args=None):
@@ -448,55 +534,82 @@ class Boxes:
         for part in parts:
             self.addPart(part)
 
+    def __getattr__(self, name):
+        # parts added by _buildObjects() are created on first use
+        factories = self.__dict__.get("_partFactories")
+        if factories and name in factories:
+            setattr(self, name, factories.pop(name)())
+            return self.__dict__[name]
+        raise AttributeError("'%s' object has no attribute '%s'" % (
+            type(self).__name__, name))
+
     def _buildObjects(self):
-        """Add default edges and parts """
-        self.edges = {}
+        """Add default edges and parts
+
+        Except for "e" and "E" they are created when used for the first time.
+        """
+        self.edges = EdgeDict()
+        thickness = self.thickness
+        edgesettings = {name : dict(values) for name, values
+                        in self.edgesettings.items()}
+        settings = {}
+
+        def getSettings(cls, name):
+            # one settings object per kind shared by all edges and parts
+            if name not in settings:
+                settings[name] = cls(thickness, True,
+                                     **edgesettings.get(name, {}))
+            return settings[name]
+
+        def addFamily(chars, cls, name):
+            self.edges.addFamily(chars, lambda : getSettings(
+                cls, name).edgeObjects(self, add=False))
+
+        self._partFactories = factories = {}
+
         self.addPart(edges.Edge(self, None))
         self.addPart(edges.OutSetEdge(self, None))
-        edges.GripSettings(self.thickness).edgeObjects(self)
+        self.edges.addFamily("g", lambda : edges.GripSettings(
+            thickness).edgeObjects(self, add=False))
 
         # Finger joints
         # Share settings object
-        s = edges.FingerJointSettings(self.thickness, True,
-                **self.edgesettings.get("FingerJoint", {}))
-        s.edgeObjects(self)
-        self.addPart(edges.FingerHoles(self, s), name="fingerHolesAt")
+        addFamily("fFh", edges.FingerJointSettings, "FingerJoint")
+        factories["fingerHolesAt"] = lambda : edges.FingerHoles(
+            self, getSettings(edges.FingerJointSettings, "FingerJoint"))
         # Stackable
-        edges.StackableSettings(self.thickness, True,
-            **self.edgesettings.get("Stackable", {})).edgeObjects(self)
+        self.edges.addFamily("sS", lambda : getSettings(
+            edges.StackableSettings, "Stackable").edgeObjects(
+                self, add=False, fingersettings=getSettings(
+                    edges.FingerJointSettings, "FingerJoint")))
         # Dove tail joints
-        edges.DoveTailSettings(self.thickness, True,
-            **self.edgesettings.get("DoveTail", {})).edgeObjects(self)
+        addFamily("dD", edges.DoveTailSettings, "DoveTail")
         # Flex
-        s = edges.FlexSettings(self.thickness, True,
-                **self.edgesettings.get("Flex", {}))
-        self.addPart(edges.FlexEdge(self, s))
+        self.edges.addFamily("X", lambda : [edges.FlexEdge(
+            self, getSettings(edges.FlexSettings, "Flex"))])
         # Clickable
-        edges.ClickSettings(self.thickness, True,
-                **self.edgesettings.get("Click", {})).edgeObjects(self)
+        addFamily("cC", edges.ClickSettings, "Click")
         # Hinges
-        edges.HingeSettings(self.thickness, True,
-                **self.edgesettings.get("Hinge", {})).edgeObjects(self)
-        edges.ChestHingeSettings(self.thickness, True,
-                **self.edgesettings.get("ChestHinge", {})).edgeObjects(self)
-        edges.CabinetHingeSettings(self.thickness, True,
-                **self.edgesettings.get("CabinetHinge", {})).edgeObjects(self)
+        addFamily("iIjJkK", edges.HingeSettings, "Hinge")
+        addFamily("oOpPqQ", edges.ChestHingeSettings, "ChestHinge")
+        addFamily("uUvV", edges.CabinetHingeSettings, "CabinetHinge")
         # Sliding Lid
-        edges.LidSettings(self.thickness, True,
-                **self.edgesettings.get("Lid", {})).edgeObjects(self)
+        addFamily("lLnmNM", edges.LidSettings, "Lid")
         # Rounded Triangle Edge
-        edges.RoundedTriangleEdgeSettings(self.thickness, True,
-                **self.edgesettings.get("RoundedTriangleEdge", {})).edgeObjects(self)
+        addFamily("t", edges.RoundedTriangleEdgeSettings,
+                  "RoundedTriangleEdge")
 
         # Nuts
-        self.addPart(NutHole(self, None))
+        factories["nutHole"] = lambda : NutHole(self, None)
         # Gears
-        self.addPart(gears.Gears(self))
-        s = edges.GearSettings(self.thickness, True,
-                **self.edgesettings.get("Gear", {}))
-        self.addPart(edges.RackEdge(self, s))
-        self.addPart(pulley.Pulley(self))
-        self.addPart(parts.Parts(self))
+        factories["gears"] = lambda : gears.Gears(self)
+        self.edges.addFamily("R", lambda : [edges.RackEdge(
+            self, getSettings(edges.GearSettings, "Gear"))])
+        factories["pulley"] = lambda : pulley.Pulley(self)
+        factories["parts"] = lambda : parts.Parts(self)
+        # replace parts from a previous run like setting them did
+        for name in factories:
+            self.__dict__.pop(name, None)
 
     def adjustSize(self, l, e1=True, e2=True):
         try:
@@ -581,23 +694,42 @@ class Boxes:
     def close(self):
         """Finish rendering
 
-        Flush canvas to disk and convert output to requested format if needed.
-        Call after .render()"""
+        Convert drawing to requested format and write it to .output
+        (unless it is None). Call after .render()
+
+        :return: the resulting document as bytes
+        """
         if self.ctx == None:
             return
 
         self.ctx.stroke()
         self.ctx = None
-        self.surface.flush()
-        self.surface.finish()
+        data = self.formats.getData(self.surface, self.format,
+                                    self.edgesettings, self.precision)
 
-        self.formats.convert(self.output, self.format)
+        if self.output:
+            with open(self.output, "wb") as f:
+                f.write(data)
         if self.inkscapefile:
             try:
                 out = sys.stdout.buffer
             except AttributeError:
                 out= sys.stdout
-            svgutil.svgMerge(self.output, self.inkscapefile, out)
+            svgutil.svgMerge(io.BytesIO(data), self.inkscapefile, out)
+        return data
+
+    def renderToBytes(self):
+        """Render the generator in memory
+
+        Does not touch the file system (unless pstoedit is needed for
+        the format). Call after .parseArgs()
+
+        :return: the resulting document as bytes
+        """
+        self.output = None
+        self.open()
+        self.render()
+        return self.close()
 
     ############################################################
     ### Turtle graphics commands
@@ -646,12 +778,6 @@ class Boxes:
             self.corner(lang/2., radius)
             return
 
-        if radius > 0.5* self.thickness and abs(degrees) > 36:
-            steps = int(abs(degrees)/ 36.) + 1
-            for i in range(steps):
-                self.corner(float(degrees)/steps, radius)
-            return
-
         if degrees > 0:
             self.ctx.arc(0, radius + self.burn, radius + self.burn,
                          -0.5 * math.pi, rad - 0.5 * math.pi)
@@ -1028,6 +1154,7 @@ class Boxes:
 
         if not before:
             self.ctx.stroke()
+            self.ctx.end_part()
             # restore position
             self.ctx.restore()
 
@@ -1043,6 +1170,7 @@ class Boxes:
             if before:
                 # save position
                 self.ctx.save()
+                self.ctx.new_part()
                 if self.debug:
                     self.ctx.rectangle(0, 0, x, y)
                 if "mirror" in terms:
@@ -1063,12 +1191,7 @@ class Boxes:
         """
         r += self.burn
         self.moveTo(x + r, y)
-        a = 0
-        n = 10
-        da = 2 * math.pi / n
-        for i in range(n):
-            self.ctx.arc(-r, 0, r, a, a+da)
-            a += da
+        self.ctx.arc(-r, 0, r, 0, 2 * math.pi)
         self.ctx.stroke()
 
     @restore
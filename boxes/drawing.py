@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+# Copyright (C) 2013-2019 Florian Festi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Backend neutral recording of the drawing
+
+The turtle graphics commands of boxes.Boxes draw on a Context that
+offers the subset of the cairo API Boxes.py uses. Instead of painting
+it records everything into a Surface that is made of Parts which
+hold stroked Paths. The coordinates are stored in absolute mm (y axis
+pointing up) with all transformations already applied. The output
+formats then work on this data only.
+"""
+
+import math
+from array import array
+from collections import defaultdict
+
+# Path commands and the number of parameters each one takes
+MOVE, LINE, CURVE, ARC, CLOSE, TEXT = range(6)
+NPARAMS = (2, 2, 6, 5, 0, 7)
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+def mmul(m1, m2):
+    """Multiply two affine matrices (m1 applied first)
+
+    Matrices are tuples (xx, yx, xy, yy, x0, y0) like in cairo.
+    """
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (a1 * a2 + b1 * c2, a1 * b2 + b1 * d2,
+            c1 * a2 + d1 * c2, c1 * b2 + d1 * d2,
+            e1 * a2 + f1 * c2 + e2, e1 * b2 + f1 * d2 + f2)
+
+def minvert(m):
+    """Invert an affine matrix"""
+    a, b, c, d, e, f = m
+    det = a * d - b * c
+    a, b, c, d = d / det, -b / det, -c / det, a / det
+    return (a, b, c, d, -e * a - f * c, -e * b - f * d)
+
+def mapply(m, x, y):
+    """Transform point (x, y) with matrix m"""
+    return (m[0] * x + m[2] * y + m[4], m[1] * x + m[3] * y + m[5])
+
+def arcToCurves(cx, cy, r, a1, a2):
+    """Approximate an arc by cubic bezier curves
+
+    :param cx: center
+    :param cy: center
+    :param r: radius
+    :param a1: start angle in radians
+    :param a2: end angle in radians (smaller than a1 for negative direction)
+    :return: list of (x1, y1, x2, y2, x3, y3) tuples
+    """
+    n = max(1, int(math.ceil(abs(a2 - a1) / (0.5 * math.pi) - 1e-9)))
+    da = (a2 - a1) / n
+    k = 4.0 / 3.0 * math.tan(da / 4.0)
+    curves = []
+    a = a1
+    for i in range(n):
+        c1, s1 = math.cos(a), math.sin(a)
+        c2, s2 = math.cos(a + da), math.sin(a + da)
+        curves.append((cx + r * (c1 - k * s1), cy + r * (s1 + k * c1),
+                       cx + r * (c2 + k * s2), cy + r * (s2 - k * c2),
+                       cx + r * c2, cy + r * s2))
+        a += da
+    return curves
+
+def curveToLines(p0, p1, p2, p3, tolerance=0.1):
+    """Approximate a cubic bezier curve by straight lines
+
+    :param p0: start point
+    :param p1: control point
+    :param p2: control point
+    :param p3: end point
+    :param tolerance: (Default value = 0.1) maximum deviation in mm
+    :return: list of points excluding p0
+    """
+    ddx = max(abs(p0[0] - 2 * p1[0] + p2[0]), abs(p1[0] - 2 * p2[0] + p3[0]))
+    ddy = max(abs(p0[1] - 2 * p1[1] + p2[1]), abs(p1[1] - 2 * p2[1] + p3[1]))
+    n = max(1, int(math.ceil((0.75 * (ddx * ddx + ddy * ddy) ** 0.5 /
+                              tolerance) ** 0.5)))
+    points = []
+    for i in range(1, n + 1):
+        t = i / n
+        s = 1 - t
+        a, b, c, d = s * s * s, 3 * s * s * t, 3 * s * t * t, t * t * t
+        points.append((a * p0[0] + b * p1[0] + c * p2[0] + d * p3[0],
+                       a * p0[1] + b * p1[1] + c * p2[1] + d * p3[1]))
+    return points
+
+def arcToLines(cx, cy, r, a1, a2, tolerance=0.1):
+    """Approximate an arc by straight lines
+
+    :param tolerance: (Default value = 0.1) maximum deviation in mm
+    :return: list of points excluding the start point
+    """
+    if r > tolerance:
+        step = 2 * math.acos(1 - tolerance / r)
+    else:
+        step = math.pi
+    n = max(1, int(math.ceil(abs(a2 - a1) / step)))
+    da = (a2 - a1) / n
+    return [(cx + r * math.cos(a1 + i * da), cy + r * math.sin(a1 + i * da))
+            for i in range(1, n + 1)]
+
+def sortPolylines(polylines, pos=(0.0, 0.0)):
+    """Order polylines to keep the travel between them short
+
+    Greedily picks the polyline starting closest to the end of the
+    previous one. Start points are kept in a grid so this does not
+    get quadratic for the thousands of holes of a plate.
+
+    :param polylines: list of lists of points
+    :param pos: (Default value = (0.0, 0.0)) start position
+    :return: sorted list
+    """
+    if len(polylines) < 3:
+        return list(polylines)
+    xs = [l[0][0] for l in polylines]
+    ys = [l[0][1] for l in polylines]
+
+    def build(items):
+        # about one start point per cell
+        bx = [xs[i] for i in items]
+        by = [ys[i] for i in items]
+        size = max(max(bx) - min(bx), max(by) - min(by)) / len(items)**0.5
+        size = size or 1.0
+        grid = defaultdict(list)
+        for i in items:
+            grid[int(xs[i] // size), int(ys[i] // size)].append(i)
+        bounds = (int(min(bx) // size), int(max(bx) // size),
+                  int(min(by) // size), int(max(by) // size))
+        return grid, size, bounds
+
+    def ring(gx, gy, r):
+        if r == 0:
+            yield gx, gy
+            return
+        for c in range(gx - r, gx + r + 1):
+            yield c, gy - r
+            yield c, gy + r
+        for c in range(gy - r + 1, gy + r):
+            yield gx - r, c
+            yield gx + r, c
+
+    left = built = len(polylines)
+    grid, size, (x0, x1, y0, y1) = build(range(left))
+    result = []
+    while left:
+        if left <= built // 2:
+            # keep the grid dense - searching empty cells gets expensive
+            built = left
+            grid, size, (x0, x1, y0, y1) = build(
+                [i for cell in grid.values() for i in cell])
+        gx, gy = int(pos[0] // size), int(pos[1] // size)
+        # rings of cells around pos before the grid and after all of it
+        near = max(x0 - gx, gx - x1, y0 - gy, gy - y1, 0)
+        far = max(gx - x0, x1 - gx, gy - y0, y1 - gy)
+        best, dist, r = None, float("inf"), near
+        # search rings of cells around pos until nothing closer can follow
+        while r <= far and (best is None or dist > (r - 1) * size):
+            if (2 * r + 1)**2 > 4 * left:
+                # more cells than start points - check all of them
+                best = min((i for cell in grid.values() for i in cell),
+                           key=lambda i: math.hypot(xs[i] - pos[0],
+                                                    ys[i] - pos[1]))
+                break
+            for c in ring(gx, gy, r):
+                for i in grid.get(c, ()):
+                    d = math.hypot(xs[i] - pos[0], ys[i] - pos[1])
+                    if d < dist:
+                        best, dist = i, d
+            r += 1
+        cell = grid[int(xs[best] // size), int(ys[best] // size)]
+        cell.remove(best)
+        if not cell:
+            del grid[int(xs[best] // size), int(ys[best] // size)]
+        left -= 1
+        result.append(polylines[best])
+        pos = polylines[best][-1]
+    return result
+
+def arcExtents(cx, cy, r, a1, a2):
+    """Points spanning the bounding box of an arc
+
+    :return: end points and the extreme points crossed by the arc
+    """
+    points = [(cx + r * math.cos(a1), cy + r * math.sin(a1)),
+              (cx + r * math.cos(a2), cy + r * math.sin(a2))]
+    lo, hi = min(a1, a2), max(a1, a2)
+    q = int(math.ceil(lo / (0.5 * math.pi)))
+    while q * 0.5 * math.pi <= hi and len(points) < 6:
+        dx, dy = ((1, 0), (0, 1), (-1, 0), (0, -1))[q % 4]
+        points.append((cx + r * dx, cy + r * dy))
+        q += 1
+    return points
+
+
+class Path:
+    """Stroked path with color and line width
+
+    Commands are kept in an array of bytes with their parameters in a
+    flat array of doubles (see NPARAMS for their number).
+    """
+
+    __slots__ = ("color", "width", "commands", "params", "texts")
+
+    def __init__(self, color=(0.0, 0.0, 0.0), width=1.0):
+        self.color = tuple(color)
+        self.width = width
+        self.commands = array("B")
+        self.params = array("d")
+        self.texts = []
+
+    def __len__(self):
+        return len(self.commands)
+
+    def add(self, command, *params):
+        if command == MOVE and self.commands and self.commands[-1] == MOVE:
+            # consecutive moves collapse into one as in cairo
+            self.params[-2:] = array("d", params)
+            return
+        if command == ARC and self.commands and self.commands[-1] == ARC:
+            # join arcs continuing the previous one (up to a full circle)
+            cx, cy, r, a1, a2 = self.params[-5:]
+            da = params[4] - params[3]
+            d = params[3] - a2
+            d -= 2 * math.pi * round(d / (2 * math.pi))
+            if (abs(d) < 1e-9 and (da > 0) == (a2 > a1) and
+                abs(a2 - a1 + da) <= 2 * math.pi + 1e-9 and
+                abs(params[0] - cx) < 1e-9 and abs(params[1] - cy) < 1e-9 and
+                abs(params[2] - r) < 1e-9):
+                self.params[-1] = a2 + da
+                return
+        self.commands.append(command)
+        self.params.extend(params)
+
+    def segments(self):
+        """Iterate over (command, params) tuples"""
+        p = self.params
+        pos = 0
+        for c in self.commands:
+            n = NPARAMS[c]
+            yield c, p[pos:pos+n]
+            pos += n
+
+    def polylines(self, tolerance=0.1):
+        """Return the path as list of lists of points
+
+        Curves and arcs are flattened. Every move starts a new polyline.
+        Text is ignored.
+
+        :param tolerance: (Default value = 0.1) maximum deviation in mm
+        """
+        result = []
+        points = []
+        for c, p in self.segments():
+            if c == MOVE:
+                points = [(p[0], p[1])]
+                result.append(points)
+            elif c == LINE:
+                points.append((p[0], p[1]))
+            elif c == CURVE:
+                points.extend(curveToLines(points[-1], p[0:2], p[2:4],
+                                           p[4:6], tolerance))
+            elif c == ARC:
+                points.extend(arcToLines(*p, tolerance=tolerance))
+            elif c == CLOSE:
+                points.append(points[0])
+        return [l for l in result if len(l) > 1]
+
+
+class Part:
+    """Paths of one part as placed by Boxes.move()
+
+    Parts placed by move() within another part belong to the outer one.
+    """
+
+    __slots__ = ("name", "paths", "bbox", "strokes")
+
+    def __init__(self, name=None):
+        self.name = name
+        self.paths = []
+        self.bbox = [float("inf"), float("inf"), -float("inf"), -float("inf")]
+        self.strokes = {} # (color, width) -> Path
+
+    def stroke(self, path):
+        """Add a stroked path
+
+        Paths of the same color and line width are merged so there is
+        only one of them per color in each part.
+        """
+        key = (path.color, path.width)
+        batch = self.strokes.get(key)
+        if batch is None:
+            self.strokes[key] = path
+            self.paths.append(path)
+        else:
+            batch.commands.extend(path.commands)
+            batch.params.extend(path.params)
+
+    def extents(self):
+        """Envelope of the part as (minx, miny, maxx, maxy) or None"""
+        if self.bbox[0] > self.bbox[2]:
+            return None
+        return tuple(self.bbox)
+
+
+class Surface:
+    """Recorded drawing - a list of Parts"""
+
+    def __init__(self):
+        self.parts = []
+        self.new_part()
+
+    def extend(self, x, y):
+        """Grow the envelope of the current part to include point (x, y)"""
+        bbox = self.bbox
+        if x < bbox[0]:
+            bbox[0] = x
+        if x > bbox[2]:
+            bbox[2] = x
+        if y < bbox[1]:
+            bbox[1] = y
+        if y > bbox[3]:
+            bbox[3] = y
+
+    def extents(self):
+        """Envelope of everything drawn as (minx, miny, maxx, maxy) or None"""
+        boxes = [b for b in (part.extents() for part in self.parts) if b]
+        if not boxes:
+            return None
+        return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+    def new_part(self, name=None):
+        """Start a new part unless the current one is still empty"""
+        if self.parts and not self.parts[-1].paths:
+            self.parts[-1].name = name
+        else:
+            self.parts.append(Part(name))
+            # extend() works on the bbox of the current part
+            self.bbox = self.parts[-1].bbox
+        return self.parts[-1]
+
+    @property
+    def part(self):
+        return self.parts[-1]
+
+    def paths(self):
+        """Iterate over all paths of all parts"""
+        for part in self.parts:
+            for path in part.paths:
+                yield path
+
+
+class Context:
+    """Cairo like drawing context recording to a Surface
+
+    Only the part of the cairo API used by Boxes.py is supported.
+
+    :param surface: Surface to record to
+    :param fontmetrics: (Default value = None) callable (face, size, text)
+                        returning the same tuple as cairo's text_extents
+    """
+
+    def __init__(self, surface, fontmetrics=None):
+        self.surface = surface
+        self.fontmetrics = fontmetrics
+        self._m = IDENTITY
+        self._rgb = (0.0, 0.0, 0.0)
+        self._width = 1.0
+        self._font = ("sans-serif", 10.0)
+        self._stack = []
+        self._path = None
+        self._xy = None # current point in surface coordinates
+        self._start = None # start of the current sub path
+        self._joined = False # sub path continues the previous one
+        self._parts = 0 # nesting of new_part() / end_part()
+
+    ### state
+
+    def save(self):
+        self._stack.append((self._m, self._rgb, self._width, self._font))
+
+    def restore(self):
+        self._m, self._rgb, self._width, self._font = self._stack.pop()
+
+    def translate(self, dx, dy):
+        self._m = mmul((1.0, 0.0, 0.0, 1.0, dx, dy), self._m)
+
+    def rotate(self, angle):
+        c, s = math.cos(angle), math.sin(angle)
+        self._m = mmul((c, s, -s, c, 0.0, 0.0), self._m)
+
+    def scale(self, sx, sy):
+        self._m = mmul((sx, 0.0, 0.0, sy, 0.0, 0.0), self._m)
+
+    def get_matrix(self):
+        return self._m
+
+    def set_source_rgb(self, r, g, b):
+        self._rgb = (r, g, b)
+
+    def set_line_width(self, width):
+        self._width = width
+
+    def select_font_face(self, face, *args):
+        self._font = (face, self._font[1])
+
+    def set_font_size(self, size):
+        self._font = (self._font[0], size)
+
+    def new_part(self, name=None):
+        # parts placed within a part belong to it
+        if not self._parts:
+            self.surface.new_part(name)
+        self._parts += 1
+
+    def end_part(self):
+        self._parts -= 1
+        if not self._parts:
+            # keep what is drawn between parts out of the last one
+            self.surface.new_part()
+
+    ### path construction
+
+    def _add(self, command, *params):
+        if self._path is None:
+            self._path = Path()
+        self._path.add(command, *params)
+
+    def get_current_point(self):
+        if self._xy is None:
+            return (0.0, 0.0)
+        return mapply(minvert(self._m), *self._xy)
+
+    def _isCurrent(self, p):
+        return (self._xy is not None and
+                abs(self._xy[0] - p[0]) < 1e-9 and
+                abs(self._xy[1] - p[1]) < 1e-9)
+
+    def move_to(self, x, y):
+        p = mapply(self._m, x, y)
+        # Turtle graphics move to the current point all the time.
+        # Don't break up the path for that.
+        self._joined = self._isCurrent(p)
+        if not self._joined:
+            self._add(MOVE, *p)
+        self._xy = self._start = p
+
+    def line_to(self, x, y):
+        if self._xy is None:
+            return self.move_to(x, y)
+        p = mapply(self._m, x, y)
+        if self._isCurrent(p):
+            return
+        extend = self.surface.extend
+        extend(*self._xy)
+        extend(*p)
+        self._xy = p
+        self._add(LINE, *p)
+
+    def curve_to(self, x1, y1, x2, y2, x3, y3):
+        if self._xy is None:
+            self.move_to(x1, y1)
+        self._curve(mapply(self._m, x1, y1), mapply(self._m, x2, y2),
+                    mapply(self._m, x3, y3))
+
+    def _curve(self, p1, p2, p3):
+        """Add curve in surface coordinates"""
+        extend = self.surface.extend
+        # control points enclose the curve
+        for p in (self._xy, p1, p2, p3):
+            extend(*p)
+        self._xy = p3
+        self._add(CURVE, *(p1 + p2 + p3))
+
+    def _arc(self, xc, yc, radius, angle1, angle2):
+        m = self._m
+        start = mapply(m, xc + radius * math.cos(angle1),
+                       yc + radius * math.sin(angle1))
+        if self._xy is None:
+            self._xy = self._start = start
+            self._add(MOVE, *start)
+        elif (abs(self._xy[0] - start[0]) > 1e-9 or
+              abs(self._xy[1] - start[1]) > 1e-9):
+            self.surface.extend(*self._xy)
+            self._xy = start
+            self._add(LINE, *start)
+        if abs(angle2 - angle1) < 1e-9:
+            # nothing to draw - writers would take it for a full circle
+            return
+        a, b, c, d = m[:4]
+        det = a * d - b * c
+        if abs(a - d * math.copysign(1, det)) > 1e-9 or \
+           abs(b + c * math.copysign(1, det)) > 1e-9:
+            # not angle preserving - fall back to curves
+            for curve in arcToCurves(xc, yc, radius, angle1, angle2):
+                self._curve(mapply(m, *curve[:2]), mapply(m, *curve[2:4]),
+                            mapply(m, *curve[4:]))
+            return
+        phi = math.atan2(b, a)
+        if det < 0:
+            angle1, angle2 = -angle1, -angle2
+        cx, cy = mapply(m, xc, yc)
+        r = radius * abs(det) ** 0.5
+        for p in arcExtents(cx, cy, r, phi + angle1, phi + angle2):
+            self.surface.extend(*p)
+        self._add(ARC, cx, cy, r, phi + angle1, phi + angle2)
+        self._xy = (cx + r * math.cos(phi + angle2),
+                    cy + r * math.sin(phi + angle2))
+
+    def arc(self, xc, yc, radius, angle1, angle2):
+        while angle2 < angle1:
+            angle2 += 2 * math.pi
+        self._arc(xc, yc, radius, angle1, angle2)
+
+    def arc_negative(self, xc, yc, radius, angle1, angle2):
+        while angle2 > angle1:
+            angle2 -= 2 * math.pi
+        self._arc(xc, yc, radius, angle1, angle2)
+
+    def rectangle(self, x, y, width, height):
+        self.move_to(x, y)
+        self.line_to(x + width, y)
+        self.line_to(x + width, y + height)
+        self.line_to(x, y + height)
+        self.close_path()
+
+    def close_path(self):
+        if self._xy is None:
+            return
+        if self._joined:
+            # sub path start was not recorded as MOVE
+            if not self._isCurrent(self._start):
+                self._add(LINE, *self._start)
+        else:
+            self._add(CLOSE)
+        self._xy = self._start
+
+    def stroke(self):
+        path = self._path
+        self._path = None
+        self._xy = self._start = None
+        self._joined = False
+        if path is None or all(c == MOVE for c in path.commands):
+            return
+        if path.commands[-1] == MOVE:
+            path.commands.pop()
+            del path.params[-2:]
+        path.color = self._rgb
+        path.width = self._width
+        self.surface.part.stroke(path)
+
+    ### text
+
+    def text_extents(self, text):
+        face, size = self._font
+        if self.fontmetrics:
+            return self.fontmetrics(face, size, text)
+        # rough estimate for sans-serif fonts
+        return (0.0, -0.7 * size, 0.55 * size * len(text), 0.7 * size,
+                0.55 * size * len(text), 0.0)
+
+    def show_text(self, text):
+        """Place text at the current point
+
+        Unlike cairo this does not move the current point.
+        """
+        x, y = self.get_current_point()
+        m = mmul((1.0, 0.0, 0.0, 1.0, x, y), self._m)
+        self.surface.extend(*m[4:])
+        path = Path(self._rgb, self._width)
+        path.add(TEXT, *(m + (self._font[1],)))
+        path.texts.append((text, self._font[0]))
+        self.surface.part.paths.append(path)
@@ -18,44 +18,711 @@
 import subprocess
 import tempfile
 import os
-import cairo
+import io
 import re
-from boxes import svgutil
+import math
+import functools
+import threading
+from html import escape
+from boxes import drawing
+from boxes import edges
 
 class PSFile:
+    """Postscript file given as file name or as seekable binary file object"""
+
     def __init__(self, filename):
         self.filename = filename
 
     def adjustDocumentMedia(self):
-        with open(self.filename, "r+") as f:
-            s = f.read(1024)
-            m = re.search(r"%%BoundingBox: (\d+) (\d+) (\d+) (\d+)", s)
+        if isinstance(self.filename, str):
+            with open(self.filename, "r+b") as f:
+                self._adjustDocumentMedia(f)
+        else:
+            self._adjustDocumentMedia(self.filename)
+
+    def _adjustDocumentMedia(self, f):
+        f.seek(0)
+        s = f.read(1024)
+        m = re.search(br"%%BoundingBox: (\d+) (\d+) (\d+) (\d+)", s)
+
+        if not m:
+            raise ValueError("%%BoundingBox in Postscript file not found")
+
+        x1, y1, x2, y2 = m.groups()
+        m = re.search(br"%%DocumentMedia: \d+x\d+mm ((\d+) (\d+)) 0 \(", s)
+        f.seek(m.start(1))
+        media = b"%i %i" % (int(x1) + int(x2), int(y1) + int(y2))
+        f.write(media + b" " * (len(m.group(1)) - len(media)))
+        f.seek(0)
+
+
+_cairo = None
+
+def loadCairo():
+    """Import and return the cairo module
+
+    cairo is only needed for text metrics and for PDF and Postscript
+    output so it is imported on first use. cairocffi is preferred if it
+    is installed.
+    """
+    global _cairo
+    if _cairo is None:
+        try:
+            import cairocffi
+            cairocffi.install_as_pycairo()
+        except ImportError:
+            pass
+        import cairo
+        _cairo = cairo
+    return _cairo
+
+
+def formatNumber(v, precision):
+    """Format v with precision decimals without trailing zeros"""
+    s = "%.*f" % (precision, v)
+    if "." in s:
+        s = s.rstrip("0").rstrip(".")
+    if s == "-0":
+        s = "0"
+    return s
+
+
+def replay(paths, ctx):
+    """Draw recorded paths onto a cairo context"""
+    for path in paths:
+        ctx.set_source_rgb(*path.color)
+        ctx.set_line_width(path.width)
+        texts = iter(path.texts)
+        for c, p in path.segments():
+            if c == drawing.MOVE:
+                ctx.move_to(*p)
+            elif c == drawing.LINE:
+                ctx.line_to(*p)
+            elif c == drawing.CURVE:
+                ctx.curve_to(*p)
+            elif c == drawing.ARC:
+                if p[4] >= p[3]:
+                    ctx.arc(*p)
+                else:
+                    ctx.arc_negative(*p)
+            elif c == drawing.CLOSE:
+                ctx.close_path()
+            elif c == drawing.TEXT:
+                text, face = next(texts)
+                ctx.save()
+                ctx.transform(loadCairo().Matrix(*p[:6]))
+                ctx.select_font_face(face)
+                ctx.set_font_size(p[6])
+                ctx.move_to(0, 0)
+                ctx.show_text(text)
+                ctx.restore()
+        if not path.texts:
+            ctx.stroke()
+
+
+class SVGWriter:
+    """Write a drawing.Surface as SVG
+
+    The size of the document is taken from the extents of the drawing
+    so the file is written in one go.
+    """
+
+    def __init__(self, surface, settings=None, precision=3):
+        self.surface = surface
+        self.precision = precision
+
+    def viewPort(self):
+        """Return (minx, miny, maxx, maxy) of the page in mm"""
+        extents = self.surface.extents()
+        if extents is None:
+            extents = (0, 0, 10, 10)
+        minx, miny, maxx, maxy = extents
+
+        if 0 <= minx <= 50:
+            minx = 0
+        else:
+            minx = 10 * int(minx // 10) - 10
+        maxx = 10 * int(maxx // 10) + 10
+        miny = 10 * int(miny // 10) - 10
+        maxy = 10 * int(maxy // 10) + 10
+        return minx, miny, maxx, maxy
+
+    def subpaths(self, path):
+        """Split path into full circles and the other sub paths
+
+        :return: list of (cx, cy, r) and list of (command, params) of the rest
+        """
+        circles, rest, sub = [], [], []
+
+        def flush():
+            if (len(sub) in (2, 3) and sub[1][0] == drawing.ARC and
+                abs(sub[1][1][4] - sub[1][1][3]) >= 2 * math.pi - 1e-9 and
+                (len(sub) == 2 or sub[2][0] == drawing.CLOSE)):
+                circles.append(tuple(sub[1][1][:3]))
+            else:
+                rest.extend(sub)
+
+        for c, p in path.segments():
+            if c == drawing.MOVE:
+                flush()
+                sub = []
+            sub.append((c, p))
+        flush()
+        return circles, rest
+
+    def num(self, v):
+        s = formatNumber(v, self.precision)
+        # SVG allows leaving out the leading zero
+        if s.startswith("0."):
+            return s[1:]
+        if s.startswith("-0."):
+            return "-" + s[2:]
+        return s
+
+    def pathData(self, segments, dx, dy):
+        """Return the d attribute of segments moved by (dx, dy) with y flipped
+
+        Coordinates are rounded to self.precision. Every command is
+        written relative to the current point where this is shorter.
+        Relative values are calculated from the rounded absolute ones
+        so the rounding errors do not add up.
+        """
+        num, prec = self.num, self.precision
+        d = []
+        x0 = y0 = sx = sy = 0.0 # current point and start of sub path
+
+        def shortest(*commands):
+            return min(commands, key=len)
+
+        for c, p in segments:
+            if c == drawing.MOVE:
+                x, y = round(p[0] + dx, prec), round(dy - p[1], prec)
+                d.append(shortest(
+                    "M%s %s" % (num(x), num(y)),
+                    "m%s %s" % (num(x - x0), num(y - y0))))
+                x0, y0 = sx, sy = x, y
+            elif c == drawing.LINE:
+                x, y = round(p[0] + dx, prec), round(dy - p[1], prec)
+                rx, ry = num(x - x0), num(y - y0)
+                if ry == "0":
+                    d.append(shortest("H" + num(x), "h" + rx))
+                elif rx == "0":
+                    d.append(shortest("V" + num(y), "v" + ry))
+                else:
+                    d.append(shortest("L%s %s" % (num(x), num(y)),
+                                      "l%s %s" % (rx, ry)))
+                x0, y0 = x, y
+            elif c == drawing.CURVE:
+                pts = [round(p[0] + dx, prec), round(dy - p[1], prec),
+                       round(p[2] + dx, prec), round(dy - p[3], prec),
+                       round(p[4] + dx, prec), round(dy - p[5], prec)]
+                d.append(shortest(
+                    "C" + " ".join(num(v) for v in pts),
+                    "c" + " ".join(num(v - (x0, y0)[i % 2])
+                                   for i, v in enumerate(pts))))
+                x0, y0 = pts[4:]
+            elif c == drawing.ARC:
+                cx, cy, r, a1, a2 = p
+                # split into pieces of at most 180 degrees
+                n = max(1, int(math.ceil(abs(a2 - a1) / math.pi - 1e-9)))
+                da = (a2 - a1) / n
+                sweep = 1 if da > 0 else 0
+                rs = num(r)
+                for i in range(1, n+1):
+                    a = a1 + i * da
+                    x = round(cx + r * math.cos(a) + dx, prec)
+                    y = round(dy - cy - r * math.sin(a), prec)
+                    d.append(shortest(
+                        "A%s %s 0 0 %i %s %s" % (rs, rs, sweep, num(x), num(y)),
+                        "a%s %s 0 0 %i %s %s" % (rs, rs, sweep, num(x - x0),
+                                                 num(y - y0))))
+                    x0, y0 = x, y
+            elif c == drawing.CLOSE:
+                d.append("Z")
+                x0, y0 = sx, sy
+        return "".join(d)
+
+    def text(self, path, dx, dy):
+        result = []
+        texts = iter(path.texts)
+        for c, p in path.segments():
+            if c != drawing.TEXT:
+                continue
+            text, face = next(texts)
+            m = drawing.mmul(p[:6], (1.0, 0.0, 0.0, -1.0, dx, dy))
+            result.append(
+                '<text transform="matrix(%s)" font-family="%s" font-size="%s" '
+                'fill="%s">%s</text>\n' % (
+                    ",".join(self.num(v) for v in m), escape(face),
+                    self.num(p[6]), self.color(path.color),
+                    escape(text, False)))
+        return "".join(result)
+
+    def color(self, color):
+        return "rgb(%i,%i,%i)" % tuple(int(round(255 * c)) for c in color)
+
+    def width(self, path):
+        # not rounded to self.precision - thin lines would vanish
+        return "%g" % path.width
+
+    def write(self, f):
+        """Write SVG to binary file object f"""
+        minx, miny, maxx, maxy = self.viewPort()
+        width, height = maxx - minx, maxy - miny
+        dx, dy = -minx, maxy
+        f.write(("""<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="%imm" height="%imm" viewBox="0 0 %i %i" version="1.1">
+""" % (width, height, width, height)).encode("utf-8"))
+
+        for nr, part in enumerate(self.surface.parts):
+            if not part.paths:
+                continue
+            result = ['<g id="p-%i">\n' % nr]
+            for path in part.paths:
+                if path.texts:
+                    result.append(self.text(path, dx, dy))
+                    continue
+                circles, segments = self.subpaths(path)
+                color = self.color(path.color)
+                for cx, cy, r in circles:
+                    result.append(
+                        '<circle cx="%s" cy="%s" r="%s" fill="none" '
+                        'stroke="%s" stroke-width="%s"/>\n' % (
+                            self.num(cx + dx), self.num(dy - cy),
+                            self.num(r), color, self.width(path)))
+                if segments:
+                    result.append(
+                        '<path d="%s" fill="none" stroke="%s" '
+                        'stroke-width="%s" stroke-linecap="round" '
+                        'stroke-linejoin="round"/>\n' % (
+                            self.pathData(segments, dx, dy),
+                            color, self.width(path)))
+            result.append("</g>\n")
+            f.write("".join(result).encode("utf-8"))
+        f.write(b"</svg>\n")
+
+
+class DXFWriter:
+    """Write a drawing.Surface as DXF
+
+    Written as AutoCAD R12 (AC1009) which all CAD and CAM programs read.
+    Connected lines and arcs become POLYLINEs (with the arcs as bulges
+    of the VERTEXes). Single lines, arcs and circles are written as LINE,
+    ARC and CIRCLE. Bezier curves are flattened. There is one layer per
+    color. White paths (text backgrounds) are skipped as ACI 7 is already
+    used for black.
+    """
+
+    # AutoCAD Color Index of the colors in boxes.Color
+    aci = {
+        (0.0, 0.0, 0.0): 7,
+        (0.0, 0.0, 1.0): 5,
+        (0.0, 1.0, 0.0): 3,
+        (1.0, 0.0, 0.0): 1,
+    }
+
+    layernames = {
+        (0.0, 0.0, 0.0): "BLACK",
+        (0.0, 0.0, 1.0): "BLUE",
+        (0.0, 1.0, 0.0): "GREEN",
+        (1.0, 0.0, 0.0): "RED",
+    }
+
+    white = (1.0, 1.0, 1.0)
+
+    def __init__(self, surface, settings=None, precision=3, tolerance=0.1):
+        self.surface = surface
+        self.precision = precision
+        self.tolerance = tolerance
+
+    def num(self, v):
+        return formatNumber(v, self.precision)
+
+    def layer(self, color):
+        color = tuple(float(c) for c in color)
+        return self.layernames.get(
+            color, "RGB_%02x%02x%02x" % tuple(int(round(255 * c))
+                                             for c in color))
+
+    def polyline(self, out, layer, vertices):
+        """Write list of (x, y, bulge, arc) as LINE, ARC or POLYLINE"""
+        if len(vertices) < 2:
+            return
+        if len(vertices) == 2:
+            (x1, y1, bulge, arc), (x2, y2, _, _) = vertices
+            if arc:
+                self.arc(out, layer, *arc)
+            else:
+                out.append("0\nLINE\n8\n%s\n10\n%s\n20\n%s\n11\n%s\n21\n%s\n" % (
+                    (layer,) + tuple(map(self.num, (x1, y1, x2, y2)))))
+            return
+        out.append("0\nPOLYLINE\n8\n%s\n66\n1\n10\n0\n20\n0\n30\n0\n"
+                   "70\n0\n" % layer)
+        for x, y, bulge, arc in vertices:
+            out.append("0\nVERTEX\n8\n%s\n10\n%s\n20\n%s\n" % (
+                layer, self.num(x), self.num(y)))
+            if bulge:
+                out.append("42\n%s\n" % formatNumber(bulge, 6))
+        out.append("0\nSEQEND\n8\n%s\n" % layer)
+
+    def arc(self, out, layer, cx, cy, r, a1, a2):
+        if abs(a2 - a1) < 1e-9:
+            return # would be read as full circle
+        if abs(a2 - a1) >= 2 * math.pi - 1e-9:
+            out.append("0\nCIRCLE\n8\n%s\n10\n%s\n20\n%s\n40\n%s\n" % (
+                layer, self.num(cx), self.num(cy), self.num(r)))
+            return
+        if a2 < a1: # DXF arcs always go counter clockwise
+            a1, a2 = a2, a1
+        out.append("0\nARC\n8\n%s\n10\n%s\n20\n%s\n40\n%s\n50\n%f\n51\n%f\n" % (
+            layer, self.num(cx), self.num(cy), self.num(r),
+            math.degrees(a1), math.degrees(a2)))
+
+    def text(self, out, layer, path):
+        texts = iter(path.texts)
+        for c, p in path.segments():
+            if c != drawing.TEXT:
+                continue
+            text, face = next(texts)
+            m = p[:6]
+            out.append(
+                "0\nTEXT\n8\n%s\n10\n%f\n20\n%f\n40\n%f\n1\n%s\n50\n%f\n" % (
+                    layer, m[4], m[5], 0.7 * p[6] * math.hypot(m[0], m[1]),
+                    text, math.degrees(math.atan2(m[1], m[0]))))
+
+    def entities(self, path):
+        layer = self.layer(path.color)
+        out = []
+        if path.texts:
+            self.text(out, layer, path)
+            return out
+        vertices = []
+        start = pos = None
+        for c, p in path.segments():
+            if c == drawing.MOVE:
+                self.polyline(out, layer, vertices)
+                start = pos = (p[0], p[1])
+                vertices = [pos + (0, None)]
+            elif c == drawing.LINE:
+                pos = (p[0], p[1])
+                vertices.append(pos + (0, None))
+            elif c == drawing.CURVE:
+                for pos in drawing.curveToLines(
+                        pos, p[0:2], p[2:4], p[4:6], self.tolerance):
+                    vertices.append(pos + (0, None))
+            elif c == drawing.ARC:
+                cx, cy, r, a1, a2 = p
+                if abs(a2 - a1) < 1e-9:
+                    continue
+                if abs(a2 - a1) >= 2 * math.pi - 1e-9 and len(vertices) < 2:
+                    # lonely circle
+                    self.arc(out, layer, cx, cy, r, a1, a2)
+                    continue
+                # arcs become bulges of the polyline
+                n = max(1, int(math.ceil(abs(a2 - a1) / math.pi - 1e-9)))
+                da = (a2 - a1) / n
+                for i in range(n):
+                    a = a1 + i * da
+                    vertices[-1] = pos + (math.tan(da / 4), (cx, cy, r, a, a + da))
+                    pos = (cx + r * math.cos(a + da), cy + r * math.sin(a + da))
+                    vertices.append(pos + (0, None))
+            elif c == drawing.CLOSE:
+                pos = start
+                vertices.append(pos + (0, None))
+        self.polyline(out, layer, vertices)
+        return out
 
-            if not m:
-                raise ValueError("%%BoundingBox in Postscript file not found")
+    def write(self, f):
+        """Write DXF to binary file object f"""
+        paths = [path for path in self.surface.paths()
+                 if path.texts or
+                 tuple(float(c) for c in path.color) != self.white]
+        layers = {}
+        for path in paths:
+            layers[self.layer(path.color)] = self.aci.get(
+                tuple(float(c) for c in path.color), 7)
+        extents = self.surface.extents() or (0, 0, 0, 0)
 
-            x1, y1, x2, y2 = m.groups()
-            m = re.search(r"%%DocumentMedia: \d+x\d+mm ((\d+) (\d+)) 0 \(", s)
-            f.seek(m.start(1))
-            media = "%i %i" % (int(x1) + int(x2), int(y1) + int(y2))
-            f.write(media + " " * (len(m.group(1)) - len(media)))
+        header = ["0\nSECTION\n2\nHEADER\n"
+                  "9\n$ACADVER\n1\nAC1009\n"
+                  "9\n$INSUNITS\n70\n4\n"
+                  "9\n$EXTMIN\n10\n%f\n20\n%f\n"
+                  "9\n$EXTMAX\n10\n%f\n20\n%f\n"
+                  "0\nENDSEC\n" % extents,
+                  "0\nSECTION\n2\nTABLES\n"
+                  "0\nTABLE\n2\nLTYPE\n70\n1\n"
+                  "0\nLTYPE\n2\nCONTINUOUS\n70\n0\n3\nSolid line\n"
+                  "72\n65\n73\n0\n40\n0.0\n"
+                  "0\nENDTAB\n"
+                  "0\nTABLE\n2\nLAYER\n70\n%i\n" % len(layers)]
+        for name, color in sorted(layers.items()):
+            header.append("0\nLAYER\n2\n%s\n70\n0\n62\n%i\n6\nCONTINUOUS\n" % (
+                name, color))
+        header.append("0\nENDTAB\n0\nENDSEC\n0\nSECTION\n2\nENTITIES\n")
+        f.write("".join(header).encode("utf-8"))
+
+        for path in paths:
+            f.write("".join(self.entities(path)).encode("utf-8"))
+        f.write(b"0\nENDSEC\n0\nEOF\n")
+
+
+class GCodeSettings(edges.Settings):
+    """Settings for G-code output
+
+Values:
+
+* absolute_params
+
+ * feed : 1000.0 : feed rate for cutting the outlines (black) in mm/min
+ * power : 1000.0 : laser power (S value) for cutting the outlines
+ * passes : 1 : number of passes for the outlines
+ * hole_feed : 1000.0 : feed rate for cutting holes (blue) in mm/min
+ * hole_power : 1000.0 : laser power (S value) for cutting holes
+ * hole_passes : 1 : number of passes for holes
+ * mark_feed : 3000.0 : feed rate for marking (other colors) in mm/min
+ * mark_power : 300.0 : laser power (S value) for marking
+ * mark_passes : 1 : number of passes for marking
+ * laser_on : M4 : command for switching the laser on (M4: dynamic power, M3: constant power)
+"""
+
+    absolute_params = {
+        "feed": 1000.0,
+        "power": 1000.0,
+        "passes": 1,
+        "hole_feed": 1000.0,
+        "hole_power": 1000.0,
+        "hole_passes": 1,
+        "mark_feed": 3000.0,
+        "mark_power": 300.0,
+        "mark_passes": 1,
+        "laser_on": ("M4", "M3"),
+    }
+
+
+class GCodeWriter:
+    """Write a drawing.Surface as G-code for laser cutters
+
+    Arcs are written as G2/G3 moves and only bezier curves are flattened.
+    The color of a path selects the operation: blue paths are holes, black
+    paths outlines and other colors are marked with lower power. White
+    paths (text backgrounds) and text are skipped. Within each part
+    markings are done first, then the holes and the outlines last so the
+    part does not move before it is finished. The controller is expected
+    to keep the laser off during G0 moves (e.g. GRBL in laser mode).
+    """
+
+    operations = {
+        (0.0, 0.0, 0.0): "cut",
+        (0.0, 0.0, 1.0): "hole",
+        (1.0, 1.0, 1.0): None,
+    }
+
+    def __init__(self, surface, settings=None, precision=3, tolerance=0.1):
+        self.surface = surface
+        self.settings = GCodeSettings(0.0, False,
+                                      **(settings or {}).get("GCode", {}))
+        self.precision = precision
+        self.tolerance = tolerance
+
+    def xy(self, x, y):
+        return "X%s Y%s" % (formatNumber(x, self.precision),
+                            formatNumber(y, self.precision))
+
+    def operation(self, color):
+        return self.operations.get(tuple(float(c) for c in color), "mark")
+
+    def profile(self, operation):
+        """Return (feed, power, passes) for operation"""
+        prefix = "" if operation == "cut" else operation + "_"
+        s = self.settings
+        return (getattr(s, prefix + "feed"), getattr(s, prefix + "power"),
+                getattr(s, prefix + "passes"))
+
+    def moves(self, path):
+        """Return the G-code moves of path as list of lines"""
+        out = []
+        start = pos = None
+        for c, p in path.segments():
+            if c == drawing.MOVE:
+                start = pos = (p[0], p[1])
+                out.append("G0 " + self.xy(*pos))
+            elif c == drawing.LINE:
+                pos = (p[0], p[1])
+                out.append("G1 " + self.xy(*pos))
+            elif c == drawing.CURVE:
+                for pos in drawing.curveToLines(
+                        pos, p[0:2], p[2:4], p[4:6], self.tolerance):
+                    out.append("G1 " + self.xy(*pos))
+            elif c == drawing.ARC:
+                cx, cy, r, a1, a2 = p
+                # split into pieces of at most 180 degrees so full
+                # circles are not ambiguous
+                n = max(1, int(math.ceil(abs(a2 - a1) / math.pi - 1e-9)))
+                da = (a2 - a1) / n
+                cmd = "G3" if da > 0 else "G2"
+                for i in range(1, n+1):
+                    a = a1 + i * da
+                    end = (cx + r * math.cos(a), cy + r * math.sin(a))
+                    if self.xy(*end) == self.xy(*pos):
+                        # controllers cut a full circle if start == end
+                        continue
+                    out.append("%s %s I%s J%s" % (
+                        cmd, self.xy(*end),
+                        formatNumber(cx - pos[0], self.precision),
+                        formatNumber(cy - pos[1], self.precision)))
+                    pos = end
+            elif c == drawing.CLOSE:
+                pos = start
+                out.append("G1 " + self.xy(*pos))
+        return out
+
+    def write(self, f):
+        """Write G-code to binary file object f"""
+        laser_on = self.settings.laser_on
+        f.write(b"; generated by boxes.py\nG21\nG90\nM5\n")
+        for part in self.surface.parts:
+            jobs = {}
+            for path in part.paths:
+                if path.texts:
+                    continue
+                op = self.operation(path.color)
+                if op is not None:
+                    jobs.setdefault(op, []).extend(self.moves(path))
+            for op in ("mark", "hole", "cut"):
+                if not jobs.get(op):
+                    continue
+                feed, power, passes = self.profile(op)
+                out = ["; %s\n%s S%g\nG1 F%g\n" % (
+                    op, laser_on, power, feed)]
+                for i in range(passes):
+                    out.append("\n".join(jobs[op]))
+                    out.append("\n")
+                out.append("M5\n")
+                f.write("".join(out).encode("utf-8"))
+        f.write(b"G0 X0 Y0\nM2\n")
+
+
+class HPGLWriter:
+    """Write a drawing.Surface as HPGL for plotters and vinyl cutters
+
+    Every color gets its own pen. The paths of each pen are drawn part by
+    part with the pen up travel between them kept short. Curves and arcs
+    are flattened. The drawing is moved to start at the origin.
+    """
+
+    units = 40.0 # plotter units per mm
+
+    pens = {
+        (0.0, 0.0, 0.0): 1,
+        (0.0, 0.0, 1.0): 2,
+        (1.0, 0.0, 0.0): 3,
+        (0.0, 1.0, 0.0): 4,
+        (1.0, 1.0, 1.0): None, # text backgrounds
+    }
+
+    def __init__(self, surface, settings=None, precision=3, tolerance=0.025):
+        self.surface = surface
+        self.tolerance = tolerance
+        self.extrapens = {}
+
+    def pen(self, color):
+        color = tuple(float(c) for c in color)
+        if color in self.pens:
+            return self.pens[color]
+        return self.extrapens.setdefault(
+            color, len(self.pens) + len(self.extrapens))
+
+    def write(self, f):
+        """Write HPGL to binary file object f"""
+        jobs = {}
+        for part in self.surface.parts:
+            lines = {}
+            for path in part.paths:
+                if path.texts:
+                    continue
+                pen = self.pen(path.color)
+                if pen is not None:
+                    lines.setdefault(pen, []).extend(
+                        path.polylines(self.tolerance))
+            for pen, l in lines.items():
+                jobs.setdefault(pen, []).append(l)
+
+        minx, miny = (self.surface.extents() or (0, 0))[:2]
+        u = self.units
+        pos = (minx, miny)
+        out = ["IN;"]
+        for pen in sorted(jobs):
+            out.append("SP%i;" % pen)
+            for lines in jobs[pen]:
+                for line in drawing.sortPolylines(lines, pos):
+                    points = ["%i,%i" % (round((x - minx) * u),
+                                         round((y - miny) * u))
+                              for x, y in line]
+                    out.append("PU%s;PD%s;" % (points[0], ",".join(points[1:])))
+                    pos = line[-1]
+        out.append("PU;SP0;\n")
+        f.write("\n".join(out).encode("ascii"))
+
+
+class PDFWriter:
+    """Write a drawing.Surface as PDF with cairo
+
+    The page is cropped to the drawing. With pages=True every part gets a
+    page of its own. Parts placed inside other parts stay on the page of
+    the outer part.
+    """
+
+    mm2pt = 72 / 25.4
+
+    def __init__(self, surface, settings=None, precision=3, pages=False):
+        self.surface = surface
+        self.pages = pages
+
+    def page(self, target, extents, margin, paths):
+        minx, miny, maxx, maxy = extents
+        minx, miny = minx - margin, miny - margin
+        width = (maxx - minx + margin) * self.mm2pt
+        height = (maxy - miny + margin) * self.mm2pt
+        target.set_size(width, height)
+        ctx = loadCairo().Context(target)
+        ctx.translate(0, height)
+        ctx.scale(self.mm2pt, -self.mm2pt)
+        ctx.translate(-minx, -miny)
+        replay(paths, ctx)
+        ctx.show_page()
+
+    def write(self, f):
+        """Write PDF to binary file object f"""
+        margin = 0.5 * max([p.width for p in self.surface.paths()] or [0])
+        target = loadCairo().PDFSurface(f, 1, 1)
+        if self.pages:
+            for part in self.surface.parts:
+                extents = part.extents()
+                if part.paths and extents:
+                    self.page(target, extents, margin, part.paths)
+        else:
+            self.page(target, self.surface.extents() or (0, 0, 10, 10),
+                      margin, self.surface.paths())
+        target.finish()
 
 
 class Formats:
 
     pstoedit = "/usr/bin/pstoedit"
 
-    _BASE_FORMATS = ['svg', 'svg_Ponoko', 'ps']
+    _BASE_FORMATS = ['svg', 'svg_Ponoko', 'ps', 'dxf', 'gcode', 'plt',
+                     'pdf', 'pdf_pages']
 
     formats = {
         "svg": None,
         "svg_Ponoko": None,
         "ps": None,
-        "dxf": "-flat 0.1 -f dxf:-mm".split(),
-        "gcode": "-f gcode".split(),
-        "plt": "-f plot-hpgl".split(),
+        "dxf": None,
+        "gcode": None,
+        "plt": None,
         "ai": "-f ps2ai".split(),
-        "pdf": "-f pdf".split(),
+        "pdf": None,
+        "pdf_pages": None,
     }
 
     http_headers = {
@@ -63,12 +730,25 @@ class Formats:
         "svg_Ponoko": [('Content-type', 'image/svg+xml; charset=utf-8')],
         "ps": [('Content-type', 'application/postscript')],
         "dxf": [('Content-type', 'image/vnd.dxf')],
-        "plt": [('Content-type', ' application/vnd.hp-hpgl')],
+        "plt": [('Content-type', 'application/vnd.hp-hpgl')],
         "gcode": [('Content-type', 'text/plain; charset=utf-8')],
+        "pdf": [('Content-type', 'application/pdf')],
+        "pdf_pages": [('Content-type', 'application/pdf')],
 
         # "" : [('Content-type', '')],
     }
 
+    # formats written directly from the drawing
+    writers = {
+        "svg": SVGWriter,
+        "svg_Ponoko": SVGWriter,
+        "dxf": DXFWriter,
+        "gcode": GCodeWriter,
+        "plt": HPGLWriter,
+        "pdf": PDFWriter,
+        "pdf_pages": functools.partial(PDFWriter, pages=True),
+    }
+
     def __init__(self):
         pass
 
@@ -79,41 +759,83 @@ class Formats:
             return self._BASE_FORMATS
 
     def getSurface(self, fmt, filename):
+        """Return a drawing.Surface and a drawing.Context recording to it"""
+        surface = drawing.Surface()
+        ctx = drawing.Context(surface, fontmetrics=self.textExtents)
+        return surface, ctx
 
-        width = height = 10000  # mm
+    # cairo contexts must not be shared between threads
+    _fontctx = threading.local()
 
-        if fmt in ("svg", "svg_Ponoko"):
-            surface = cairo.SVGSurface(filename, width, height)
-            mm2pt = 1.0
-        else:
-            mm2pt = 72 / 25.4
-            width *= mm2pt
-            height *= mm2pt  # 3.543307
-            surface = cairo.PSSurface(filename, width, height)
+    def textExtents(self, face, size, text):
+        ctx = getattr(self._fontctx, "ctx", None)
+        if ctx is None:
+            cairo = loadCairo()
+            ctx = self._fontctx.ctx = cairo.Context(
+                cairo.ImageSurface(cairo.FORMAT_A8, 1, 1))
+        ctx.select_font_face(face)
+        ctx.set_font_size(size)
+        return ctx.text_extents(text)
+
+    def render(self, surface, fmt, f, settings=None, precision=3):
+        """Write the recorded drawing in format fmt
 
-        ctx = cairo.Context(surface)
+        :param surface: drawing.Surface
+        :param fmt: format name
+        :param f: binary file object to write to
+        :param settings: (Default value = None) dict of settings by prefix as in Boxes.edgesettings
+        :param precision: (Default value = 3) decimals of the coordinates in mm
+        """
+        if fmt in self.writers:
+            self.writers[fmt](surface, settings, precision).write(f)
+            return
+
+        cairo = loadCairo()
+        ps = io.BytesIO()
+        mm2pt = 72 / 25.4
+        width = height = 10000 * mm2pt  # 10000mm
+        target = cairo.PSSurface(ps, width, height)
+
+        ctx = cairo.Context(target)
         ctx.translate(0, height)
         ctx.scale(mm2pt, -mm2pt)
+        self.replay(surface, ctx)
+        target.flush()
+        target.finish()
+        PSFile(ps).adjustDocumentMedia()
 
-        return surface, ctx
+        if fmt == "ps":
+            f.write(ps.getvalue())
+        else:
+            f.write(self.convert(ps.getvalue(), fmt))
 
-    def convert(self, filename, fmt):
+    def getData(self, surface, fmt, settings=None, precision=3):
+        """Return the recorded drawing in format fmt as bytes"""
+        f = io.BytesIO()
+        self.render(surface, fmt, f, settings, precision)
+        return f.getvalue()
 
-        if fmt in ['svg', 'svg_Ponoko']:
-            svg = svgutil.SVGFile(filename)
-            svg.getEnvelope()
-            svg.rewriteViewPort()
-        else:
-            ps = PSFile(filename)
-            ps.adjustDocumentMedia()
+    def replay(self, surface, ctx):
+        """Draw the recorded paths onto a cairo context"""
+        replay(surface.paths(), ctx)
+
+    def convert(self, data, fmt):
+        """Convert Postscript data to fmt with pstoedit and return the result
 
-        if fmt not in self._BASE_FORMATS:
-            fd, tmpfile = tempfile.mkstemp(dir=os.path.dirname(filename))
-            cmd = [self.pstoedit] + self.formats[fmt] + [filename, tmpfile]
+        pstoedit needs real files so they are created in a temporary
+        directory.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            infile = os.path.join(tmpdir, "in.ps")
+            outfile = os.path.join(tmpdir, "out")
+            with open(infile, "wb") as f:
+                f.write(data)
+            cmd = [self.pstoedit] + self.formats[fmt] + [infile, outfile]
             err = subprocess.call(cmd)
 
             if err:
                 # XXX show stderr output
                 raise ValueError("Conversion failed. pstoedit returned %i" % err)
 
-            os.rename(tmpfile, filename)
+            with open(outfile, "rb") as f:
+                return f.read()
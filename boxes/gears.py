@@ -41,10 +41,8 @@ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 			Fixed https://github.com/jnweiger/inkscape-gears-dev
 '''
 
-from os import devnull # for debugging
 from math import pi, cos, sin, tan, radians, degrees, ceil, asin, acos, sqrt
 two_pi = 2 * pi
-import argparse
 from boxes.vectors import kerf, vdiff, vlength
 
 __version__ = '0.9'
@@ -243,152 +241,84 @@ def generate_spur_points(teeth, base_radius, pitch_radius, outer_radius, root_ra
 def inkbool(val):
     return val not in ("False", False, "0", 0, "None", None)
 
-class OptionParser(argparse.ArgumentParser):
+class GearOptions:
+    """Options of a gear
 
-    types = {
-        "int" : int,
-        "float" : float,
-        "string" : str,
-        "inkbool" : inkbool,
-        }
+    Built from keyword arguments named like the long options of the
+    original Inkscape extension (with "_" instead of "-") or like the
+    attributes. Values are converted to the type of the option.
+    """
 
-    def add_option(self, short, long_, **kw):
-        kw["type"] = self.types[kw["type"]]
-        names = []
-        if short:
-            names.append("-" + short.replace("-", "_")[1:])
-        if long_:
-            names.append("--" + long_.replace("-", "_")[2:])
-        self.add_argument(*names, **kw)
+    # (option name, attribute, type, default, help)
+    options = (
+        ("teeth", "teeth", int, 24,
+         "Number of teeth"),
+        ("system", "system", str, 'MM',
+         "Select system: 'CP' (Cyclic Pitch (default)), 'DP' (Diametral Pitch), 'MM' (Metric Module)"),
+        ("dimension", "dimension", float, 1.0,
+         "Tooth size, depending on system (which defaults to CP)"),
+        ("angle", "angle", float, 20.0,
+         "Pressure Angle (common values: 14.5, 20, 25 degrees)"),
+        ("profile_shift", "profile_shift", float, 20.0,
+         "Profile shift [in percent of the module]. Negative values help against undercut"),
+        ("units", "units", str, 'mm',
+         "Units this dialog is using"),
+        ("accuracy", "accuracy", int, 0,
+         "Accuracy of involute: automatic: 5..20 (default), best: 20(default), medium 10, low: 5; good acuracy is important with a low tooth count"),
+        # Clearance: Radial distance between top of tooth on one gear to bottom of gap on another.
+        ("clearance", "clearance", float, 0.0,
+         "Clearance between bottom of gap of this gear and top of tooth of another"),
+        ("annotation", "annotation", inkbool, False,
+         "Draw annotation text"),
+        ("internal_ring", "internal_ring", inkbool, False,
+         "Ring (or Internal) gear style (default: normal spur gear)"),
+        ("mount_hole", "mount_hole", float, 0.,
+         "Mount hole diameter"),
+        ("mount_diameter", "mount_diameter", float, 15,
+         "Mount support diameter"),
+        ("spoke_count", "spoke_count", int, 3,
+         "Spokes count"),
+        ("spoke_width", "spoke_width", float, 5,
+         "Spoke width"),
+        ("holes_rounding", "holes_rounding", float, 5,
+         "Holes rounding"),
+        ("active_tab", "active_tab", str, '',
+         "Active tab. Not used now."),
+        ("centercross", "centercross", inkbool, False,
+         "Draw cross in center"),
+        ("pitchcircle", "pitchcircle", inkbool, False,
+         "Draw pitch circle (for mating)"),
+        ("draw_rack", "drawrack", inkbool, False,
+         "Draw rack gear instead of spur gear"),
+        ("rack_teeth_length", "teeth_length", int, 12,
+         "Length (in teeth) of rack"),
+        ("rack_base_height", "base_height", float, 8,
+         "Height of base of rack"),
+        ("rack_base_tab", "base_tab", float, 14,
+         "Length of tabs on ends of rack"),
+        ("undercut_alert", "undercut_alert", inkbool, False,
+         "Let the user confirm a warning dialog if undercut occurs. This dialog also shows helpful hints against undercut"),
+    )
+
+    byname = {}
+    for option in options:
+        byname[option[0]] = byname[option[1]] = option
+    del option
+
+    def __init__(self, **kw):
+        for name, dest, type_, default, help in self.options:
+            setattr(self, dest, default)
+        for name, value in kw.items():
+            try:
+                name, dest, type_, default, help = self.byname[name]
+            except KeyError:
+                raise ValueError("Unknown gear option: %s" % name)
+            setattr(self, dest, type_(value))
 
 class Gears():
 
     def __init__(self, boxes, **kw):
-        # an alternate way to get debug info:
-        # could use inkex.debug(string) instead...
-        try:
-            self.tty = open("/dev/tty", 'w')
-        except:
-            self.tty = open(devnull, 'w')  # '/dev/null' for POSIX, 'nul' for Windows.
-            # print >>self.tty, "gears-dev " + __version__
-
         self.boxes = boxes
-        self.OptionParser = OptionParser()
-        self.OptionParser.add_option("-t", "--teeth",
-                                     action="store", type="int",
-                                     dest="teeth", default=24,
-                                     help="Number of teeth")
-
-        self.OptionParser.add_option("-s", "--system",
-                                     action="store", type="string", 
-                                     dest="system", default='MM',
-                                     help="Select system: 'CP' (Cyclic Pitch (default)), 'DP' (Diametral Pitch), 'MM' (Metric Module)")
-
-        self.OptionParser.add_option("-d", "--dimension",
-                                     action="store", type="float",
-                                     dest="dimension", default=1.0,
-                                     help="Tooth size, depending on system (which defaults to CP)")
-
-
-        self.OptionParser.add_option("-a", "--angle",
-                                     action="store", type="float",
-                                     dest="angle", default=20.0,
-                                     help="Pressure Angle (common values: 14.5, 20, 25 degrees)")
-
-        self.OptionParser.add_option("-p", "--profile-shift",
-                                     action="store", type="float",
-                                     dest="profile_shift", default=20.0,
-                                     help="Profile shift [in percent of the module]. Negative values help against undercut")
-
-        self.OptionParser.add_option("-u", "--units",
-                                     action="store", type="string",
-                                     dest="units", default='mm',
-                                     help="Units this dialog is using")
-
-        self.OptionParser.add_option("-A", "--accuracy",
-                                     action="store", type="int",
-                                     dest="accuracy", default=0,
-                                     help="Accuracy of involute: automatic: 5..20 (default), best: 20(default), medium 10, low: 5; good acuracy is important with a low tooth count")
-        # Clearance: Radial distance between top of tooth on one gear to bottom of gap on another.
-        self.OptionParser.add_option("", "--clearance",
-                                     action="store", type="float",
-                                     dest="clearance", default=0.0,
-                                     help="Clearance between bottom of gap of this gear and top of tooth of another")
-
-        self.OptionParser.add_option("", "--annotation",
-                                     action="store", type="inkbool", 
-                                     dest="annotation", default=False,
-                                     help="Draw annotation text")
-
-        self.OptionParser.add_option("-i", "--internal-ring",
-                                     action="store", type="inkbool",
-                                     dest="internal_ring", default=False,
-                                     help="Ring (or Internal) gear style (default: normal spur gear)")
-
-        self.OptionParser.add_option("", "--mount-hole",
-                                     action="store", type="float",
-                                     dest="mount_hole", default=0.,
-                                     help="Mount hole diameter")
-
-        self.OptionParser.add_option("", "--mount-diameter",
-                                     action="store", type="float",
-                                     dest="mount_diameter", default=15,
-                                     help="Mount support diameter")
-
-        self.OptionParser.add_option("", "--spoke-count",
-                                     action="store", type="int",
-                                     dest="spoke_count", default=3,
-                                     help="Spokes count")
-
-        self.OptionParser.add_option("", "--spoke-width",
-                                     action="store", type="float",
-                                     dest="spoke_width", default=5,
-                                     help="Spoke width")
-
-        self.OptionParser.add_option("", "--holes-rounding",
-                                     action="store", type="float",
-                                     dest="holes_rounding", default=5,
-                                     help="Holes rounding")
-
-        self.OptionParser.add_option("", "--active-tab",
-                                     action="store", type="string",
-                                     dest="active_tab", default='',
-                                     help="Active tab. Not used now.")
-
-        self.OptionParser.add_option("-x", "--centercross",
-                                     action="store", type="inkbool", 
-                                     dest="centercross", default=False,
-                                     help="Draw cross in center")
-
-        self.OptionParser.add_option("-c", "--pitchcircle",
-                                     action="store", type="inkbool",
-                                     dest="pitchcircle", default=False,
-                                     help="Draw pitch circle (for mating)")
-
-        self.OptionParser.add_option("-r", "--draw-rack",
-                                     action="store", type="inkbool", 
-                                     dest="drawrack", default=False,
-                                     help="Draw rack gear instead of spur gear")
-
-        self.OptionParser.add_option("", "--rack-teeth-length",
-                                     action="store", type="int",
-                                     dest="teeth_length", default=12,
-                                     help="Length (in teeth) of rack")
-
-        self.OptionParser.add_option("", "--rack-base-height",
-                                     action="store", type="float",
-                                     dest="base_height", default=8,
-                                     help="Height of base of rack")
-
-        self.OptionParser.add_option("", "--rack-base-tab",
-                                     action="store", type="float",
-                                     dest="base_tab", default=14,
-                                     help="Length of tabs on ends of rack")
-
-        self.OptionParser.add_option("", "--undercut-alert",
-                                     action="store", type="inkbool", 
-                                     dest="undercut_alert", default=False,
-                                     help="Let the user confirm a warning dialog if undercut occurs. This dialog also shows helpful hints against undercut")
 
     def drawPoints(self, lines, kerfdir=1, close=True):
 
@@ -512,7 +442,7 @@ class Gears():
         return messages
 
     def sizes(self, **kw):
-        self.options = self.OptionParser.parse_args(["--%s=%s" % (name,value) for name, value in kw.items()])
+        self.options = GearOptions(**kw)
         # Pitch (circular pitch): Length of the arc from one tooth to the next)
         # Pitch diameter: Diameter of pitch circle.
         pitch = self.calc_circular_pitch()
@@ -574,7 +504,7 @@ class Gears():
               iterate through them
             - Turn on other visual features e.g. cross, rack, annotations, etc
         """
-        self.options = self.OptionParser.parse_args(["--%s=%s" % (name,value) for name, value in kw.items()])
+        self.options = GearOptions(**kw)
 
         warnings = [] # list of extra messages to be shown in annotations
         # calculate unit factor for units defined in dialog. 
@@ -1,3 +1,5 @@
+import os
+import json
 import pkgutil
 import inspect
 import importlib
@@ -53,3 +55,89 @@ def getAllGeneratorModules():
         generators[modname.split('.')[-1]] = module
     return generators
 
+
+class GeneratorInfo:
+    """Generator as listed in the manifest - without importing its module
+
+    Has __name__, __doc__, ui_group and webinterface like the generator
+    class and can be called like it to create a generator object.
+    """
+
+    def __init__(self, name, module, doc="", ui_group="Misc",
+                 webinterface=True):
+        self.__name__ = name
+        self.module = module
+        self.__doc__ = doc
+        self.ui_group = ui_group
+        self.webinterface = webinterface
+
+    def load(self):
+        """Import the module and return the generator class"""
+        return getattr(importlib.import_module(self.module), self.__name__)
+
+    def __call__(self, *args, **kw):
+        return self.load()(*args, **kw)
+
+def _manifestSignature():
+    """Names, sizes and modification times of the files the manifest
+    depends on"""
+    files = [boxes.__file__] + sorted(
+        os.path.join(__path__[0], f) for f in os.listdir(__path__[0])
+        if f.endswith(".py"))
+    signature = []
+    for f in files:
+        st = os.stat(f)
+        signature.append([os.path.abspath(f), st.st_size, st.st_mtime_ns])
+    return signature
+
+def _manifestFile():
+    cachedir = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    return os.path.join(cachedir, "boxes", "generators.json")
+
+def buildManifest():
+    """Import all generators and return the manifest data"""
+    generators = []
+    for name, box in sorted(getAllBoxGenerators().items()):
+        if name.rsplit(".", 1)[0] != box.__module__:
+            continue # imported from another generator module
+        generators.append({
+            "name" : box.__name__,
+            "module" : box.__module__,
+            "doc" : box.__doc__ or "",
+            "ui_group" : box.ui_group,
+            "webinterface" : box.webinterface,
+        })
+    return generators
+
+def getGeneratorManifest(filename=None):
+    """Return GeneratorInfo objects for all generators by name
+
+    The manifest is cached in filename (default
+    ~/.cache/boxes/generators.json). It is rebuilt by importing all
+    generators if any of the generator modules changed.
+
+    :param filename: (Default value = None) cache file
+    """
+    filename = filename or _manifestFile()
+    signature = _manifestSignature()
+    try:
+        with open(filename) as f:
+            data = json.load(f)
+        if data["signature"] != signature:
+            data = None
+    except (OSError, ValueError, KeyError, TypeError):
+        data = None
+
+    if data is None:
+        data = {"signature" : signature, "generators" : buildManifest()}
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            tmp = "%s.%i" % (filename, os.getpid())
+            with open(tmp, "w") as f:
+                json.dump(data, f, indent=1)
+            os.replace(tmp, filename)
+        except OSError:
+            pass # work without cache
+
+    return {g["name"] : GeneratorInfo(**g) for g in data["generators"]}
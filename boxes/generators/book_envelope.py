@@ -97,7 +97,6 @@ class BookEnvelope(Boxes):
 
         # render your parts here
         self.bookEnvelope(move='right')
-        self.close()
 
 
     def bookEnvelope(self, move=None):
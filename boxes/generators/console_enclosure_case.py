@@ -273,7 +273,6 @@ class ConsoleEnclosureCase(Boxes):
                 self.drawHoles("upper_panel")
                 self.rectangularWall(self.width, upper_panel_sidelength, "eFFF", bedBolts=None, move="right")
 
-        self.close()
 
 
     def drawHoles(self, partname):
@@ -0,0 +1,46 @@
+import importlib.machinery
+import importlib.util
+import os
+import signal
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+pytest.importorskip("markdown")
+loader = importlib.machinery.SourceFileLoader(
+    "boxesserver", os.path.join(os.path.dirname(__file__), "..", "scripts",
+                                "boxesserver"))
+spec = importlib.util.spec_from_loader("boxesserver", loader)
+boxesserver = importlib.util.module_from_spec(spec)
+loader.exec_module(boxesserver)
+
+
+class FakeBox:
+
+    def parseArgs(self, args):
+        self.args = args
+
+
+class FakeServer:
+    """Just enough of BServer for the RenderPool"""
+
+    def __init__(self):
+        self.metrics = boxesserver.Metrics()
+
+    def getBox(self, name):
+        return FakeBox()
+
+    def renderBox(self, name, box, timings):
+        return ("%s %s" % (name, " ".join(box.args))).encode("utf-8")
+
+
+def test_pool_survives_dead_spawner():
+    pool = boxesserver.RenderPool(FakeServer(), workers=2, jobs=1)
+    os.kill(pool.spawnerProcess.pid, signal.SIGKILL)
+    pool.spawnerProcess.join()
+    # every job replaces its worker
+    for i in range(6):
+        assert pool.render("Box", ["--x=%i" % i]) == b"Box --x=%i" % i
+    assert pool.idle.qsize() == 2
@@ -0,0 +1,43 @@
+import math
+import os
+import random
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from boxes.drawing import sortPolylines
+
+
+def travel(polylines):
+    return sum(math.dist(a[-1], b[0]) for a, b in zip(polylines, polylines[1:]))
+
+
+def test_sort_polylines_greedy():
+    rnd = random.Random(1)
+    for n in range(3, 40):
+        polylines = [[(rnd.uniform(-50, 50), rnd.uniform(-50, 50)),
+                      (rnd.uniform(-500, 500), rnd.uniform(-500, 500))]
+                     for i in range(n)]
+        # brute force
+        left, pos, expected = list(polylines), (0.0, 0.0), []
+        while left:
+            best = min(left, key=lambda l: math.dist(l[0], pos))
+            left.remove(best)
+            expected.append(best)
+            pos = best[-1]
+        assert travel(sortPolylines(polylines)) == pytest.approx(
+            travel(expected))
+
+
+def test_sort_polylines_sparse():
+    rnd = random.Random(2)
+    polylines = [[(rnd.uniform(0, 1e4), rnd.uniform(0, 1e4)),
+                  (rnd.uniform(0, 1e4), rnd.uniform(0, 1e4))]
+                 for i in range(20000)]
+    t = time.time()
+    result = sortPolylines(polylines)
+    assert time.time() - t < 10
+    assert len(result) == len(polylines)
@@ -0,0 +1,73 @@
+import io
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import boxes
+from boxes import drawing, formats
+
+
+def square(width):
+    surface = drawing.Surface()
+    ctx = drawing.Context(surface)
+    ctx.set_line_width(width)
+    ctx.rectangle(0, 0, 10, 10)
+    ctx.stroke()
+    ctx.move_to(23, 5)
+    ctx.arc(20, 5, 3, 0, 2 * math.pi)
+    ctx.stroke()
+    return surface
+
+
+def test_svg_stroke_width_not_rounded():
+    for precision in (0, 1):
+        f = io.BytesIO()
+        formats.SVGWriter(square(0.01), precision=precision).write(f)
+        svg = f.getvalue().decode("utf-8")
+        assert 'stroke-width="0"' not in svg
+        assert svg.count('stroke-width="0.01"') == 2
+
+
+def test_dxf_tables_and_white():
+    surface = square(0.1)
+    ctx = drawing.Context(surface)
+    ctx.set_source_rgb(1.0, 1.0, 1.0)
+    ctx.rectangle(0, 0, 5, 5)
+    ctx.stroke()
+    f = io.BytesIO()
+    formats.DXFWriter(surface).write(f)
+    dxf = f.getvalue().decode("utf-8")
+    assert dxf.index("\nLTYPE\n2\nCONTINUOUS\n") < dxf.index("\nLAYER\n")
+    assert "WHITE" not in dxf and "RGB_ffffff" not in dxf
+
+
+class NestedParts(boxes.Boxes):
+    """Three plates each with a part placed inside"""
+
+    def render(self):
+        for i in range(3):
+            if self.move(40, 40, "right", before=True):
+                continue
+            self.rectangularHole(20, 20, 30, 30)
+            if not self.move(10, 10, "up", before=True):
+                self.hole(5, 5, 3)
+                self.move(10, 10, "up")
+            self.hole(30, 30, 3)
+            self.move(40, 40, "right")
+
+
+def test_nested_parts():
+    box = NestedParts()
+    box.parseArgs(["--reference=0"])
+    box.open()
+    box.render()
+    parts = [p for p in box.surface.parts if p.paths]
+    assert len(parts) == 3
+    pytest.importorskip("cairo")
+    f = io.BytesIO()
+    formats.PDFWriter(box.surface, pages=True).write(f)
+    assert f.getvalue().count(b"/Type /Page\n") == 3